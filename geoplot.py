@@ -21,6 +21,7 @@
 #############################################################################################
 
 import argparse
+import io
 import cartopy.crs as ccrs
 import cartopy.feature as cf
 import numpy as np
@@ -68,24 +69,14 @@ PROJECTIONS = {
 
 def make_colormap(seq):
     """Return a LinearSegmentedColormap
-    seq: a sequence of floats and RGB-tuples. The floats should be increasing
-    and in the interval (0,1).
+    seq: a sequence of (stop, color) pairs. The stops should be increasing
+    and in the interval [0,1].
     """
-    seq = [(None,) * 3, 0.0] + list(seq) + [1.0, (None,) * 3]
-    cdict = {'red': [], 'green': [], 'blue': []}
-    for i, item in enumerate(seq):
-        if isinstance(item, float):
-            r1, g1, b1 = seq[i - 1]
-            r2, g2, b2 = seq[i + 1]
-            cdict['red'].append([item, r1, r2])
-            cdict['green'].append([item, g1, g2])
-            cdict['blue'].append([item, b1, b2])
-    return mcolors.LinearSegmentedColormap('CustomMap', cdict)
+    return mcolors.LinearSegmentedColormap.from_list('CustomMap', seq)
 
 def make_rvb_colormap():
-    c = mcolors.ColorConverter().to_rgb
-    return make_colormap([c('white'), c('white'), 0.1, c('white'), c('yellow'), 0.33, c('yellow'), c('LightGreen'), 0.66,
-                          c('LightGreen'), c('orange'), 0.8, c('orange'), c('red'), 0.95, c('red')])
+    return make_colormap([(0.0, 'white'), (0.1, 'white'), (0.33, 'yellow'), (0.66, 'LightGreen'),
+                          (0.8, 'orange'), (0.95, 'red'), (1.0, 'red')])
 
 def open_file(path: str):
     if sys.platform.startswith('darwin'):
@@ -117,13 +108,14 @@ else:
     parser.exit(message='Please specify the map type (us or world or europe)')
 
 rvb = make_rvb_colormap()
-data = np.loadtxt(sys.stdin, delimiter='\t')
+data = np.loadtxt(io.StringIO(sys.stdin.read()), delimiter='\t', dtype=np.float32)
 longranularity = data.shape[1]
 latgranularity = int(longranularity/2)
 lcenterskip = (180/longranularity)
 
-ax = plt.axes(projection=PROJECTIONS[args.proj]())
-ax.set_extent(extent, crs=PROJECTIONS[args.proj]())
+proj = PROJECTIONS[args.proj]()
+ax = plt.axes(projection=proj)
+ax.set_extent(extent, crs=proj)
 ax.add_feature(cf.COASTLINE)
 ax.add_feature(cf.BORDERS)
 
@@ -135,16 +127,15 @@ if args.grid:
              ylocs=np.arange(-90, 90, 180 / latgranularity),
              draw_labels=True, dms=True, color='gray')
 
+x = np.linspace(-180, 180, longranularity, endpoint=False, dtype=np.float32)
+y = np.linspace(-90, 90, latgranularity, endpoint=False, dtype=np.float32)
+
 if args.contour:
-    x = np.linspace(-180 + lcenterskip, 180 - lcenterskip, longranularity)
-    y = np.linspace(-90 + lcenterskip, 90 - lcenterskip, latgranularity)
-    x, y = np.meshgrid(x, y)
-    p = ax.contourf(x, y, data, cmap=rvb, zorder=1, alpha=0.8)
+    x, y = np.meshgrid(x + lcenterskip, y + lcenterskip)
+    p = ax.contourf(x, y, data, transform=ccrs.PlateCarree(), transform_first=True,
+                    algorithm='serial', cmap=rvb, zorder=1, alpha=0.8)
 else:
-    x = np.linspace(-180 , 180, longranularity, endpoint=False)
-    y = np.linspace(-90 , 90, latgranularity, endpoint=False)
-    x, y = np.meshgrid(x, y)
-    p = ax.pcolormesh(x, y, data, transform=PROJECTIONS[args.proj](), cmap=rvb, zorder=1, alpha=0.8)
+    p = ax.pcolormesh(x, y, data, transform=proj, shading='auto', cmap=rvb, zorder=1, alpha=0.8)
 
 plt.colorbar(p, orientation='horizontal')
 
@@ -28,9 +28,10 @@ GeoLoc.prototype.sparseMatrixToMatrix = function(sparseMatrix) {
     const granularity = this.model.granularity;
     let matrix = new Array(granularity * granularity / 2);
     matrix.fill(0.0);
-    sparseMatrix.forEach(element => {
-        matrix[element.x + element.y * granularity] = element.value;
-    });
+    const xs = sparseMatrix.x, ys = sparseMatrix.y, values = sparseMatrix.value;
+    for (var i = 0, n = values.length; i < n; i++) {
+        matrix[xs[i] + ys[i] * granularity] = values[i];
+    }
     return matrix;
 }
 
@@ -178,6 +179,7 @@ GeoLoc.prototype.loadModel = function(path) {
         })
         .then(data => {
             this.model = data;
+            this.model.tweetsmatrix = this.sparseMatrixToMatrix(this.model.tweetsmatrix);
             this.model.wordmatrix = this.sparseMatrixToMatrix(this.model.wordmatrix);
         });
 }
@@ -2,29 +2,41 @@
 """Convert geoloc model to JSON format"""
 import re
 import sys
+import io
 import logging
 import argparse
 import gzip
 import os
-import json
 import platform
-from enum import Enum, auto
+import zipfile
 
+import numpy as np
 
-class Mode(Enum):
-    NONE = auto()
-    TWEETMATRIX = auto()
-    CENTROIDS = auto()
-    WORD = auto()
-    MATRIX = auto()
-    NEXTWORD = auto()
-    WORDMATRIX = auto()
+try:
+    import orjson
 
+    def json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    import json
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, default=lambda o: o.tolist()).encode('utf-8')
+
+
+SECTION_RE = re.compile(r'^(#[A-Z]+#.*)$', re.M)
+FORBIDDEN_CHARS = str.maketrans('', '', '*?\\/')
+IS_WINDOWS = platform.system() == 'Windows'
+RESERVED_WORDS = {'con', 'aux', 'prn', 'nul', 'com1', 'com2', 'com3', 'com4', 'com5',
+                  'com6', 'com7', 'com8', 'com9', 'lpt1', 'lpt2', 'lpt3', 'lpt4',
+                  'lpt5', 'lpt6', 'lpt7', 'lpt8', 'lpt9'}
 
 parser = argparse.ArgumentParser(description=sys.modules[__name__].__doc__)
 parser.add_argument('--coords', action='store_true', help='Add coords to output files')
 parser.add_argument('--weight', action='store_true', help='Add weight to output files')
 parser.add_argument('--word_id', action='store_true', help='Add word id to output files')
+parser.add_argument('--format', choices=('files', 'jsonl', 'zip'), default='files',
+                    help='Word output format: one JSON file per word, a single words.jsonl or a words.zip archive')
 parser.add_argument('model_file', help='Geoloc model file')
 parser.add_argument('output_dir', help='Model output dir')
 args = parser.parse_args()
@@ -32,16 +44,14 @@ args = parser.parse_args()
 logging.basicConfig(format='%(asctime)s %(levelname)-s: %(message)s', level=logging.INFO)
 
 
-def log_unknown_line(l: str):
-    logging.error('Unknown line: {}'.format(l))
+def log_unknown_section(header: str):
+    logging.error('Unknown section: {}'.format(header))
 
 
 def word_is_saveable(word: str) -> bool:
-    if '*' in word or '?' in word or '\\' in word or '/' in word:
+    if len(word.translate(FORBIDDEN_CHARS)) != len(word):
         return False
-    if platform.system() == 'Windows' and word in {'con', 'aux', 'prn', 'nul', 'com1', 'com2', 'com3', 'com4', 'com5',
-                                                   'com6', 'com7', 'com8', 'com9', 'lpt1', 'lpt2', 'lpt3', 'lpt4',
-                                                   'lpt5', 'lpt6', 'lpt7', 'lpt8', 'lpt9'}:
+    if IS_WINDOWS and word in RESERVED_WORDS:
         return False
     len_word = len(word)
     if len_word > 32 or len_word < 1:
@@ -49,145 +59,127 @@ def word_is_saveable(word: str) -> bool:
     return True
 
 
+def parse_section(text: str, columns: int) -> np.ndarray:
+    """Parse the numeric body of a model section in one NumPy call"""
+    if not text.strip():
+        return np.empty((0, columns))
+    return np.loadtxt(io.StringIO(text), ndmin=2)
+
+
+def triplets_to_sparse_matrix(data: np.ndarray) -> dict:
+    """Represent 'x y value' triplets as three columnar arrays"""
+    return {
+        'x': data[:, 0].astype(np.int32),
+        'y': data[:, 1].astype(np.int32),
+        'value': np.ascontiguousarray(data[:, 2])
+    }
+
+
 with gzip.open(args.model_file, 'rt', encoding='utf-8') as model:
-    mode = Mode.NONE
-    index = 0
-    model_properties = {'wordtypes': 0}
-    word_properties = {}
-
-    def save_word(word: str, properties: dict):
-        if word_is_saveable(word):
-            word_file_name = os.path.join(args.output_dir, 'words', '{word}.json'.format(word=word))
-            with open(word_file_name, 'w', encoding='utf-8') as word_file:
-                json.dump(properties, word_file, ensure_ascii=False)
-
-    def make_word_properties(word: str) -> dict:
-        model_properties['wordtypes'] += 1
-        if model_properties['wordtypes'] % 10000 == 0:
-            logging.info('Processing word {word}'.format(word=word))
-        return {}
-
-    logging.info('Starting conversion')
+    sections = SECTION_RE.split(model.read())
+
+model_properties = {'wordtypes': 0}
+word = None
+word_properties = {}
+words_file = None
+words_zip = None
+
+
+def save_word(word: str, properties: dict):
+    if not word_is_saveable(word):
+        return
+    if words_zip is not None:
+        words_zip.writestr('{word}.json'.format(word=word), json_dumps(properties))
+    elif words_file is not None:
+        words_file.write(json_dumps({'word': word, **properties}) + b'\n')
+    else:
+        word_file_name = os.path.join(args.output_dir, 'words', '{word}.json'.format(word=word))
+        with open(word_file_name, 'wb') as word_file:
+            word_file.write(json_dumps(properties))
+
+
+def make_word_properties(word: str) -> dict:
+    model_properties['wordtypes'] += 1
+    if model_properties['wordtypes'] % 10000 == 0:
+        logging.info('Processing word {word}'.format(word=word))
+    return {}
+
+
+def handle_longranularity(header: str, body: str):
+    global granularity
+    granularity = int(header.split()[1])
+    model_properties['granularity'] = granularity
+
+
+def handle_tweetmatrix(header: str, body: str):
+    model_properties['tweetsmatrix'] = triplets_to_sparse_matrix(parse_section(body, 3))
+
+
+def handle_centroids(header: str, body: str):
+    model_properties['centroids'] = parse_section(body, 2)
+
+
+def handle_word(header: str, body: str):
+    global word, word_properties
+    logging.debug(header)
+    tokens = header.split()
+    word = tokens[2]
+    word_properties = make_word_properties(word)
+    if args.weight:
+        word_properties['weight'] = float(tokens[3]) if len(tokens) == 4 else 1.0
+    if args.word_id:
+        word_properties['word_id'] = int(tokens[1])
+    if args.coords:
+        coords = parse_section(body, 2)
+        if len(coords):
+            word_properties['coords'] = coords
+
+
+def handle_matrix(header: str, body: str):
+    word_properties['matrix'] = triplets_to_sparse_matrix(parse_section(body, 3))
+
+
+def handle_wordmatrix(header: str, body: str):
+    model_properties['wordmatrix'] = triplets_to_sparse_matrix(parse_section(body, 3))
+
+
+def handle_end(header: str, body: str):
+    global word
+    if word is not None:
+        save_word(word, word_properties)
+        word = None
+
+
+HANDLERS = {
+    'LONGRANULARITY': handle_longranularity,
+    'TWEETMATRIX': handle_tweetmatrix,
+    'CENTROIDS': handle_centroids,
+    'WORD': handle_word,
+    'MATRIX': handle_matrix,
+    'WORDMATRIX': handle_wordmatrix,
+    'END': handle_end
+}
+
+
+logging.info('Starting conversion')
+if args.format == 'jsonl':
+    os.makedirs(args.output_dir, mode=0o755, exist_ok=True)
+    words_file = open(os.path.join(args.output_dir, 'words.jsonl'), 'wb', buffering=1 << 20)
+elif args.format == 'zip':
+    os.makedirs(args.output_dir, mode=0o755, exist_ok=True)
+    words_zip = zipfile.ZipFile(os.path.join(args.output_dir, 'words.zip'), 'w', zipfile.ZIP_STORED)
+else:
     os.makedirs(os.path.join(args.output_dir, 'words'), mode=0o755, exist_ok=True)
-    for line in model:
-        if mode == Mode.NONE:
-            if line.startswith('#LONGRANULARITY#'):
-                tokens = line.rstrip().split(' ')
-                granularity = int(tokens[1])
-                model_properties['granularity'] = granularity
-            elif line.startswith('#TWEETMATRIX#'):
-                model_properties['tweetsmatrix'] = [None] * (granularity * granularity // 2)
-                mode = Mode.TWEETMATRIX
-            elif line.startswith('#CENTROIDS#'):
-                index = 0
-                model_properties['centroids'] = []
-                mode = Mode.CENTROIDS
-            elif line.startswith('#WORD#'):
-                logging.debug(line.rstrip())
-                tokens = line.split(' ')
-                word = tokens[2].rstrip()
-                word_properties = make_word_properties(word)
-                if args.weight:
-                    weight = float(tokens[3]) if len(tokens) == 4 else 1.0
-                    word_properties['weight'] = weight
-                if args.word_id:
-                    word_id = int(tokens[1])
-                    word_properties['word_id'] = word_id
-                mode = Mode.WORD
-            elif line.startswith('#WORDMATRIX#'):
-                model_properties['wordmatrix'] = []
-                mode = Mode.WORDMATRIX
-            else:
-                log_unknown_line(line)
-        elif mode == Mode.TWEETMATRIX:
-            if re.match(r'^\d+ \d+ [0-9e\.+-]+', line):
-                tokens = line.rstrip().split(' ')
-                x = int(tokens[0])
-                y = int(tokens[1])
-                value = float(tokens[2])
-                model_properties['tweetsmatrix'][x + y * granularity] = value
-            elif line.startswith('#END'):
-                mode = Mode.NONE
-            else:
-                log_unknown_line(line)
-        elif mode == Mode.CENTROIDS:
-            if re.match(r'^[0-9e\.+-]+ [0-9e\.+-]+', line):
-                tokens = line.rstrip().split(' ')
-                lat = float(tokens[0])
-                lon = float(tokens[1])
-                model_properties['centroids'].insert(index, [lat, lon])
-                index += 1
-            elif line.startswith('#END#'):
-                mode = Mode.NONE
-            else:
-                log_unknown_line(line)
-        elif mode == Mode.WORD:
-            if re.match(r'^[0-9e\.+-]+ [0-9e\.+-]+', line):
-                tokens = line.rstrip().split(' ')
-                lat = float(tokens[0])
-                lon = float(tokens[1])
-                if args.coords:
-                    if 'coords' not in word_properties:
-                        word_properties['coords'] = []
-                    word_properties['coords'].append([lat, lon])
-            elif line.startswith('#MATRIX#'):
-                if 'matrix' not in word_properties:
-                    word_properties['matrix'] = []
-                mode = Mode.MATRIX
-            elif line.startswith('#END#'):
-                save_word(word, word_properties)
-                mode = Mode.NONE
-            else:
-                log_unknown_line(line)
-        elif mode == Mode.MATRIX:
-            if re.match(r'^\d+ \d+ [0-9e\.+-]+', line):
-                tokens = line.rstrip().split(' ')
-                x = int(tokens[0])
-                y = int(tokens[1])
-                value = float(tokens[2])
-                word_properties['matrix'].append({
-                    'x': x,
-                    'y': y,
-                    'value': value
-                })
-            elif line.startswith('#END#'):
-                save_word(word, word_properties)
-                mode = Mode.NEXTWORD
-            else:
-                log_unknown_line(line)
-        elif mode == Mode.NEXTWORD:
-            if line.startswith('#WORD#'):
-                logging.debug(line.rstrip())
-                tokens = line.split(' ')
-                word = tokens[2].rstrip()
-                word_properties = make_word_properties(word)
-                if args.weight:
-                    weight = float(tokens[3]) if len(tokens) == 4 else 1.0
-                    word_properties['weight'] = weight
-                if args.word_id:
-                    word_id = int(tokens[1])
-                    word_properties['word_id'] = word_id
-                mode = Mode.WORD
-            elif line.startswith('#END#'):
-                save_word(word, word_properties)
-                mode = Mode.NONE
-            else:
-                log_unknown_line(line)
-        elif mode == Mode.WORDMATRIX:
-            if re.match(r'^\d+ \d+ [0-9e\.+-]+', line):
-                tokens = line.rstrip().split(' ')
-                x = int(tokens[0])
-                y = int(tokens[1])
-                value = float(tokens[2])
-                model_properties['wordmatrix'].append({
-                    'x': x,
-                    'y': y,
-                    'value': value
-                })
-            elif line.startswith('#END#'):
-                mode = Mode.NONE
-            else:
-                log_unknown_line(line)
-    with open(os.path.join(args.output_dir, 'model.json'), 'w', encoding='utf-8') as model_file:
-        json.dump(model_properties, model_file)
-    logging.info('Finished conversion')
+for header, body in zip(sections[1::2], sections[2::2]):
+    handler = HANDLERS.get(header.split('#')[1])
+    if handler is not None:
+        handler(header, body)
+    else:
+        log_unknown_section(header)
+if words_file is not None:
+    words_file.close()
+if words_zip is not None:
+    words_zip.close()
+with open(os.path.join(args.output_dir, 'model.json'), 'wb') as model_file:
+    model_file.write(json_dumps(model_properties))
+logging.info('Finished conversion')